@@ -4,6 +4,8 @@ from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
 from math import floor, ceil
 
+from util.time_util import str_t_to_int
+
 RED = (255, 153, 153)
 YELLOW = (255, 255, 153)
 GREEN = (153, 255, 153)
@@ -42,21 +44,6 @@ boilerplate_path = os.path.join(dirname, "./boilerplate.png")
 __draw_sched_font = ImageFont.truetype(tahoma_font_path, 19)
 
 
-def str_t_to_int(str_t):
-    h = int(str_t[0:2])
-    m = int(str_t[3:5])
-    pm = str_t[6:9] == "PM"
-    if pm and h == 12:
-        return h * 60 + m
-    if pm and h < 12:
-        return (h + 12) * 60 + m
-    if not pm and h == 12:
-        return m
-    if not pm and h < 12:
-        return h * 60 + m
-    return None
-
-
 def get_draw_text(course_class, location=""):
     course_name = course_class["course"]
     class_component = course_class["component"]
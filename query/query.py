@@ -3,6 +3,7 @@ import os, sqlite3, json, sys, logging, requests
 import pytz
 from collections import defaultdict
 from datetime import datetime
+from util.time_util import str_t_to_int
 
 
 DISCORDHOOK = os.environ.get('DISCORDHOOK')
@@ -33,16 +34,6 @@ def send_discord_message(message):
             % (response.status_code, response.text)
         )
 
-def str_t_to_int(str_t):
-    h = int(str_t[0:2])
-    m = int(str_t[3:5])
-    pm = str_t[6:9] == 'PM'
-    if pm and h==12: return h*60+m
-    if pm and h<12: return (h+12)*60+m
-    if not pm and h==12: return m
-    if not pm and h<12: return h*60+m
-    return None
-
 class QueryExecutor:
     def __init__(self):
         dirname = os.path.dirname(__file__)
@@ -1,34 +1,77 @@
 from random import shuffle
 
+# Conflicts are symmetric, so each pair of class IDs is stored once in a
+# canonical order rather than once per ordering.
+def conflict_key(class_a_id, class_b_id):
+    if class_a_id < class_b_id:
+        return (class_a_id, class_b_id)
+    return (class_b_id, class_a_id)
+
 class MRV_Model:
-    def __init__(self, components, conflicts):
+    def __init__(self, components, conflicts, limit=125000, randomize=True):
         self._components = components
-        self._components.sort(key=len)
-        for i in range(len(self._components)):
-            shuffle(self._components[i])
+        if randomize:
+            for i in range(len(self._components)):
+                shuffle(self._components[i])
         self._conflicts = conflicts
         self._depth = len(self._components) - 1
         self.valid_schedules = []
         self._valid_sched_count = 0
+        self._limit = limit
+        self._build_conflict_masks()
     
     def get_valid_schedules(self):
         return self.valid_schedules
 
-    def _mrv_solve(self, curr, index):
-        for c in self._components[index]:
-            valid_pick = True
-            for c_i in curr:
-                if (c[0], c_i[0]) in self._conflicts:
-                    valid_pick = False
-                    break
-            if not valid_pick:
+    # Give every class a bit and store, per class, an int whose set bits are
+    # the classes it conflicts with. A pick is then valid if its bit is not
+    # set in the OR of the masks of the classes picked so far, which replaces
+    # a set lookup per previously picked class with a single AND. Classes are
+    # numbered flat, component after component, so component i owns bits
+    # offsets[i] up to offsets[i+1] and masks is indexed by that bit number.
+    def _build_conflict_masks(self):
+        offsets = [0]
+        for component in self._components:
+            offsets.append(offsets[-1] + len(component))
+        masks = [0] * offsets[-1]
+        for i in range(len(self._components)):
+            for j in range(i+1, len(self._components)):
+                for a, c_a in enumerate(self._components[i], offsets[i]):
+                    for b, c_b in enumerate(self._components[j], offsets[j]):
+                        if conflict_key(c_a[0], c_b[0]) in self._conflicts:
+                            masks[a] |= 1 << b
+                            masks[b] |= 1 << a
+        # Resolve every candidate to its (bit, conflict mask, class) once so the
+        # search loop only does int arithmetic, with no per-pick dict lookups.
+        self._levels = []
+        for i, component in enumerate(self._components):
+            self._levels.append([(1 << bit, masks[bit], c)
+                for bit, c in enumerate(component, offsets[i])])
+        # Smallest components are searched first; among components of the same
+        # size, the one with the most conflicts goes first since it prunes the
+        # search earliest.
+        self._levels.sort(key=lambda level: (len(level),
+            -sum(c_mask.bit_count() for _, c_mask, _ in level)))
+
+    # curr is the single partial schedule shared by the whole search; picks are
+    # pushed and popped around each recursive call and only complete schedules
+    # are copied out as tuples.
+    def _mrv_solve(self, curr, index, conflict_mask):
+        for c_bit, c_mask, c in self._levels[index]:
+            if conflict_mask & c_bit:
                 continue
             if index == self._depth:
-                self.valid_schedules.append(tuple(curr + [c]))
+                self.valid_schedules.append((*curr, c))
                 self._valid_sched_count += 1
-            if index < self._depth:
-                if self._valid_sched_count <= 125000:
-                    self._mrv_solve(curr + [c], index+1)
+            else:
+                curr.append(c)
+                self._mrv_solve(curr, index+1, conflict_mask | c_mask)
+                curr.pop()
+            if self._valid_sched_count >= self._limit:
+                return
 
+    # Enumerates valid schedules until the limit is reached. A limit of 1 makes
+    # this a cheap satisfiability check: the search stops at the first valid
+    # schedule instead of enumerating every one of them.
     def solve(self):
-        self._mrv_solve([], 0)
+        self._mrv_solve([], 0, 0)
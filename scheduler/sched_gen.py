@@ -1,58 +1,66 @@
+from heapq import nlargest
+from itertools import combinations, product
+from operator import attrgetter
 from random import shuffle
+from util.time_util import str_t_to_int
 from . import MRV
 
 ASSUMED_COMMUTE_TIME = 30
 
-def str_t_to_int(str_t):
-    h = int(str_t[0:2])
-    m = int(str_t[3:5])
-    pm = str_t[6:9] == 'PM'
-    if pm and h==12: return h*60+m
-    if pm and h<12: return (h+12)*60+m
-    if not pm and h==12: return m
-    if not pm and h<12: return h*60+m
-    return None
-
 class ValidSchedule:
-    def __init__(self, schedule, aliases, blocks, num_pages, prefs):
+    # one of these is made for every valid schedule found, so skip the per-instance dict
+    __slots__ = ("_schedule", "time_variance", "time_wasted", "gap_err", "start_err",
+        "time_wasted_rank", "time_var_rank", "gap_err_rank", "start_err_rank", "adjusted_score")
+
+    def __init__(self, schedule, blocks, prefs, day_scores):
         self._schedule = schedule
-        self._aliases = aliases
-        self._blocks = blocks
-        self._num_pages = num_pages
-        self._prefs = prefs
-        self.time_variance, self.time_wasted, self.gap_err, self.start_err = 0,0,0,0
-        self._static_evaluate()
+        self._static_evaluate(blocks, prefs, day_scores)
         self.time_wasted_rank = None
         self.time_var_rank = None
         self.gap_err_rank = None
         self.start_err_rank = None
-        self.overall_rank = None
-        self.score = None
 
-    def _static_evaluate(self):
-        ideal_consec_len = self._prefs["IDEAL_CONSECUTIVE_LENGTH"] * 60
-        ideal_start_t = self._prefs["IDEAL_START_TIME"] * 60
-        start_times, end_times = [], []
-        for day in self._blocks.keys():
-            self.time_wasted += ASSUMED_COMMUTE_TIME * 2
-            day_start_t, day_end_t = self._blocks[day][0][0], self._blocks[day][-1][1]
-            start_times.append(day_start_t)
-            end_times.append(day_end_t)
-            self.start_err += (ideal_start_t - day_start_t) **\
-                (3 if day_start_t < ideal_start_t else 2)
-            day_blocks = self._blocks[day]
-            self.time_wasted += day_end_t - day_start_t
-            for block in day_blocks:
-                block_len = block[1] - block[0]
-                self.time_wasted -= block_len
-                self.gap_err += (block_len - ideal_consec_len) **\
-                    (2 if block_len <= ideal_consec_len else 3)
-        self.start_err = self.start_err / len(self._blocks.keys())
-        avg_start_t = sum(start_times) / len(start_times)
-        avg_end_t = sum(end_times) / len(end_times)
-        start_t_var = sum([(t - avg_start_t) ** 2 for t in start_times]) / len(start_times)
-        end_t_var = sum([(t - avg_end_t) ** 2 for t in end_times]) / len(end_times)
+    # Start and end time variances are (n*sum(x^2) - sum(x)^2) / n^2 over the
+    # day start/end times. Each day's time wasted, gap error and start error
+    # are memoized in day_scores, which is shared across one ranking.
+    def _static_evaluate(self, blocks, prefs, day_scores):
+        num_days = len(blocks)
+        if num_days == 0:
+            # none of the classes have class times (e.g. some clinical placements)
+            self.time_variance, self.time_wasted, self.gap_err, self.start_err = 0, 0, 0, 0
+            return
+        ideal_consec_len = prefs["IDEAL_CONSECUTIVE_LENGTH"] * 60
+        ideal_start_t = prefs["IDEAL_START_TIME"] * 60
+        time_wasted, gap_err, start_err = 0, 0, 0
+        start_sum, start_sq_sum, end_sum, end_sq_sum = 0, 0, 0, 0
+        for day_blocks in blocks:
+            day_start_t, day_end_t = day_blocks[0][0], day_blocks[-1][1]
+            start_sum += day_start_t
+            start_sq_sum += day_start_t * day_start_t
+            end_sum += day_end_t
+            end_sq_sum += day_end_t * day_end_t
+            if day_blocks in day_scores:
+                day_time_wasted, day_gap_err, day_start_err = day_scores[day_blocks]
+            else:
+                day_start_err = (ideal_start_t - day_start_t) **\
+                    (3 if day_start_t < ideal_start_t else 2)
+                day_time_wasted = ASSUMED_COMMUTE_TIME * 2 + day_end_t - day_start_t
+                day_gap_err = 0
+                for block_start_t, block_end_t in day_blocks:
+                    block_len = block_end_t - block_start_t
+                    day_time_wasted -= block_len
+                    day_gap_err += (block_len - ideal_consec_len) **\
+                        (2 if block_len <= ideal_consec_len else 3)
+                day_scores[day_blocks] = (day_time_wasted, day_gap_err, day_start_err)
+            time_wasted += day_time_wasted
+            gap_err += day_gap_err
+            start_err += day_start_err
+        start_t_var = (num_days * start_sq_sum - start_sum * start_sum) / (num_days * num_days)
+        end_t_var = (num_days * end_sq_sum - end_sum * end_sum) / (num_days * num_days)
         self.time_variance = start_t_var * 1.5 + end_t_var
+        self.time_wasted = time_wasted
+        self.gap_err = gap_err
+        self.start_err = start_err / num_days
 
     def set_overall_rank(self):
         adjusted_combined_rank = \
@@ -66,44 +74,45 @@ class ScheduleFactory:
     def __init__(self, exhaust_threshold=500000):
         self._EXHAUST_CARDINALITY_THRESHOLD = exhaust_threshold
         self._day_index = {'M':0, 'T':1, 'W':2, 'H':3, 'R':3, 'F':4, 'S':5, 'U':6}
-        self._CONFLICTS = set()
-        self._component_blocks = {}
 
-    def _conflicts(self, class_a, class_b):
+    # Returns a pair of ints (week 1, week 2) for a class where bit
+    # day*1440 + minute is set if the class is in session at that minute.
+    # Weekly class times occupy both weeks and biweekly ones only their own, so
+    # two classes conflict iff their masks intersect in either week. These are
+    # cached per class ID in masks_cache since every class is compared against
+    # every class of the other components.
+    # 7/11/2023: consider a classtime that is an entire superset of the same classtime but in
+    # a different location. for example, C1 = 9am-5pm in E1-003 and 12pm-5pm in E1-013.
+    # we should detect this case as a non-conflict (there is a real instance of this).
+    # Overlaps within a single class are never compared, so this holds by construction.
+    def _class_masks(self, course_class, masks_cache):
+        class_id = course_class[0]
+        if class_id in masks_cache:
+            return masks_cache[class_id]
+        week_1_mask, week_2_mask = 0, 0
+        for classtime in course_class[5]:
+            start_t, end_t, biweekly = classtime[1], classtime[2], int(classtime[4])
+            if end_t <= start_t:
+                continue
+            for day in classtime[0]:
+                offset = self._day_index[day]*1440 + start_t
+                ct_mask = ((1 << (end_t - start_t)) - 1) << offset
+                if biweekly != 2:
+                    week_1_mask |= ct_mask
+                if biweekly != 1:
+                    week_2_mask |= ct_mask
+        masks_cache[class_id] = (week_1_mask, week_2_mask)
+        return masks_cache[class_id]
+
+    def _conflicts(self, class_a, class_b, conflicts, masks_cache):
         class_a_id, class_b_id = class_a[0], class_b[0]
-        if (class_a_id, class_b_id) in self._CONFLICTS:
+        if MRV.conflict_key(class_a_id, class_b_id) in conflicts:
+            return True
+        a_week_1, a_week_2 = self._class_masks(class_a, masks_cache)
+        b_week_1, b_week_2 = self._class_masks(class_b, masks_cache)
+        if a_week_1 & b_week_1 or a_week_2 & b_week_2:
+            conflicts.add(MRV.conflict_key(class_a_id, class_b_id))
             return True
-        ranges = []
-        for course_class in (class_a, class_b):
-            classtimes = course_class[5]
-            ct_ranges = []
-            for classtime in classtimes:
-                start_t, end_t = classtime[1], classtime[2]
-                for day in classtime[0]:
-                    day_mult = self._day_index[day]
-                    ct_range = (start_t + 2400*day_mult, end_t + 2400*day_mult, classtime[4])
-                    # 7/11/2023: consider a classtime that is an entire superset of the same classtime but in
-                    # a different location. for example, C1 = 9am-5pm in E1-003 and 12pm-5pm in E1-013.
-                    # we should detect this case as a non-conflict (there is a real instance of this).
-                    if len(ct_ranges) > 0:
-                        is_subset = False
-                        for (existing_range, compare_day) in ct_ranges:
-                            if day == compare_day and ct_range[0] >= existing_range[0] and ct_range[1] <= existing_range[1]:
-                                is_subset = True
-                        if not is_subset:
-                            ct_ranges.append((ct_range, day))
-                    else:
-                        ct_ranges.append((ct_range, day))
-            for (ct_range, _) in ct_ranges:
-                ranges.append(ct_range)
-        ranges.sort(key=lambda t: t[0])
-        for i in range(len(ranges)-1):
-            if ranges[i][1] > ranges[i+1][0]:
-                biweekly1, biweekly2 = int(ranges[i][2]), int(ranges[i+1][2])
-                if biweekly1 == 0 or biweekly2 == 0 or (biweekly1 == biweekly2):
-                    self._CONFLICTS.add((class_a_id, class_b_id))
-                    self._CONFLICTS.add((class_b_id, class_a_id))
-                    return True
         return False
 
     def _json_sched(self, sched):
@@ -118,53 +127,56 @@ class ScheduleFactory:
             cardinality *= len(component)
         return cardinality
 
-    def _get_schedule_blocks(self, schedule):
-        day_times_map = {}
+    # Builds on the per-class (day index, times) lists in component_blocks
+    # (from _map_components_to_blocks) rather than unpacking every class's time tuples
+    # again for each schedule. Returns the merged blocks of each day that has
+    # classes, Monday first. Many schedules share the same classes on a given
+    # day, so merged days are memoized in day_blocks_cache, keyed by the day's
+    # unmerged times.
+    def _get_schedule_blocks(self, schedule, component_blocks, day_blocks_cache):
+        day_times = [[] for _ in range(7)]
         for course_class in schedule:
-            for time_tuple in course_class[5]:
-                days, start_t, end_t, _, biweekly = time_tuple
-                for day in days:
-                    if not day in day_times_map:
-                        day_times_map[day] = [(start_t, end_t)]
-                    else:
-                        day_times_map[day].append((start_t, end_t))
-        for times in day_times_map.values():
-            if len(times) == 1:
+            for day_i, times in component_blocks[course_class[0]]:
+                day_times[day_i].extend(times)
+        blocks = []
+        for times in day_times:
+            if not times:
                 continue
-            times.sort()
-            i = 0
-            while i <= len(times)-2:
-                t_i, t_j = times[i], times[i+1]
-                if t_j[0] - t_i[1] <= 15:
-                    times[i] = (t_i[0], t_j[1])
-                    del times[i+1]
-                    i -= 1
-                i += 1
-        return day_times_map
+            times = tuple(times)
+            if times in day_blocks_cache:
+                blocks.append(day_blocks_cache[times])
+                continue
+            sorted_times = sorted(times)
+            merged = [sorted_times[0]]
+            for i in range(1, len(sorted_times)):
+                start_t, end_t = sorted_times[i]
+                if start_t - merged[-1][1] <= 15:
+                    merged[-1] = (merged[-1][0], end_t)
+                else:
+                    merged.append((start_t, end_t))
+            day_blocks_cache[times] = tuple(merged)
+            blocks.append(day_blocks_cache[times])
+        return blocks
 
-    def _master_sort(self, schedules, prefs):
+    def _master_sort(self, schedules, component_blocks, prefs):
         sched_objs = []
         num_pages = len(schedules)
+        day_blocks_cache, day_scores = {}, {}
         for schedule in schedules:
-            blocks = self._get_schedule_blocks(schedule)
-            sched_obj = ValidSchedule(schedule, [], blocks, num_pages, prefs)
+            blocks = self._get_schedule_blocks(schedule, component_blocks, day_blocks_cache)
+            sched_obj = ValidSchedule(schedule, blocks, prefs, day_scores)
             sched_objs.append(sched_obj)
-        time_var_sorted = sorted(sched_objs, key=lambda SO: SO.time_variance, reverse=True)
-        time_waste_sorted = sorted(sched_objs, key=lambda SO: SO.time_wasted, reverse=True)
-        gap_err_sorted = sorted(sched_objs, key=lambda SO: SO.gap_err, reverse=True)
-        start_err_sorted = sorted(sched_objs, key=lambda SO: SO.start_err, reverse=True)
-        for i, sched_obj in enumerate(gap_err_sorted):
-            sched_obj.gap_err_rank = i+1
-        for i, sched_obj in enumerate(time_var_sorted):
-            sched_obj.time_var_rank = i+1
-        for i, sched_obj in enumerate(time_waste_sorted):
-            sched_obj.time_wasted_rank = i+1
-        for i, sched_obj in enumerate(start_err_sorted):
-            sched_obj.start_err_rank = i+1
+        rank_attrs = (("time_variance", "time_var_rank"), ("time_wasted", "time_wasted_rank"),
+            ("gap_err", "gap_err_rank"), ("start_err", "start_err_rank"))
+        for metric, rank_attr in rank_attrs:
+            metric_sorted = sorted(sched_objs, key=attrgetter(metric), reverse=True)
+            for i, sched_obj in enumerate(metric_sorted, 1):
+                setattr(sched_obj, rank_attr, i)
         for sched_obj in sched_objs:
             sched_obj.set_overall_rank()
-        overall_sorted = sorted(sched_objs, key=lambda SO: SO.adjusted_score, reverse=True)
-        overall_sorted = overall_sorted[:min(prefs["LIMIT"], num_pages)]
+        # only the top LIMIT are returned, so select them rather than sort everything
+        overall_sorted = nlargest(min(prefs["LIMIT"], num_pages), sched_objs,
+            key=attrgetter("adjusted_score"))
         return overall_sorted
     
     # param course_list is a list of strings of form "SUBJ CATALOG" e.g. "CHEM 101".
@@ -181,24 +193,17 @@ class ScheduleFactory:
             for component in course_dict.keys():
                 component_classes = course_dict[component]
                 new_component = []
-                component_aliases = {}
                 classtime_to_first_class = {}
                 for component_class in component_classes:
-                    class_comp_str = component_class[1] + ' ' + component_class[2] # e.g., LEC A1
-                    class_times = []
-                    for i in range(len(component_class[5])):
-                        ct_i = component_class[5][i]
-                        class_times.append((ct_i[0], ct_i[1], ct_i[2], ct_i[4]))
-                    class_times = tuple(class_times)
+                    class_times = tuple((ct[0], ct[1], ct[2], ct[4]) for ct in component_class[5])
                     if class_times in classtime_to_first_class:
                         first_class = classtime_to_first_class[class_times]
+                        class_comp_str = component_class[1] + ' ' + component_class[2] # e.g., LEC A1
                         alias_info = [component_class[0], class_comp_str]
-                        component_aliases[first_class].append(alias_info)
-                        aliases[first_class] = component_aliases[first_class]
+                        aliases.setdefault(first_class, []).append(alias_info)
                     else:
                         first_class_key = component_class[0]
                         classtime_to_first_class[class_times] = first_class_key
-                        component_aliases[first_class_key] = []
                         new_component.append(component_class)
                 components.append(new_component)
         return (components, aliases)
@@ -226,26 +231,29 @@ class ScheduleFactory:
             courses.append(course)
         return courses
 
-    def _build_conflicts_set(self, components):
-        flat_classes = [e for c in components for e in c]
-        for class_a in flat_classes:
-            for class_b in flat_classes:
-                _ = self._conflicts(class_a, class_b)
+    # Only classes of different components can appear in the same schedule, and
+    # conflicts are symmetric, so each unordered pair of classes across two
+    # components is checked exactly once.
+    def _build_conflicts_set(self, components, conflicts, masks_cache):
+        for component_a, component_b in combinations(components, 2):
+            for class_a, class_b in product(component_a, component_b):
+                _ = self._conflicts(class_a, class_b, conflicts, masks_cache)
 
     def _map_components_to_blocks(self, components):
+        component_blocks = {}
         for course_class in components:
             for component in course_class:
-                if component[0] in self._component_blocks:
-                    continue
                 day_times_map = {}
                 for time_tuple in component[5]:
                     days, start_t, end_t, _, biweekly = time_tuple
                     for day in days:
-                        if not day in day_times_map:
-                            day_times_map[day] = [(start_t, end_t)]
+                        day_i = self._day_index[day]
+                        if not day_i in day_times_map:
+                            day_times_map[day_i] = [(start_t, end_t)]
                         else:
-                            day_times_map[day].append((start_t, end_t))
-                self._component_blocks[component[0]] = day_times_map
+                            day_times_map[day_i].append((start_t, end_t))
+                component_blocks[component[0]] = list(day_times_map.items())
+        return component_blocks
 
     # Generate valid schedules for a string list of courses. First construct a
     # a list of components, where a "component" is a set of classes where each
@@ -257,12 +265,21 @@ class ScheduleFactory:
     # randomly sample from every axis (component) and gather a subset of all
     # possibly valid schedules of size T.
     def generate_schedules(self, courses_obj, prefs):
+        # Conflicts, masks and the per-class day map are keyed by class ID,
+        # which is only unique within a term, so they are built per request.
+        conflicts, masks_cache = set(), {}
+        # Components are built once per course and shared by every course pair
+        # check below and by the full search, rather than rebuilt for each pair.
+        course_components, aliases = [], {}
+        for course_obj in courses_obj['objects']:
+            courses_dict = self._create_course_dict({'objects': [course_obj]})
+            (components, course_aliases) = self._create_components(courses_dict)
+            course_components.append(components)
+            aliases.update(course_aliases)
         course_conflicts = []
         for i in range(0, len(courses_obj['objects'])):
             for j in range(i+1, len(courses_obj['objects'])):
                 c1, c2 = courses_obj['objects'][i], courses_obj['objects'][j]
-                obj = {'objects': [c1, c2]}
-                courses_dict = self._create_course_dict(obj)
                 c1name, c2name = c1["objects"][0]["course"], c2["objects"][0]["course"]
                 if (c1name == "ECE 202" and c2name == "ECE 210") or (c2name == "ECE 202" and c1name == "ECE 210"):
                     for ece_class1 in c1["objects"]:
@@ -270,23 +287,21 @@ class ScheduleFactory:
                             if ece_class1["component"] != "LAB" or ece_class2["component"] != "LAB":
                                 continue
                             if ece_class1["section"] != ece_class2["section"]:
-                                self._CONFLICTS.add((ece_class1["class"], ece_class2["class"]))
-                                self._CONFLICTS.add((ece_class2["class"], ece_class1["class"]))
-                components, _ = self._create_components(courses_dict)
-                self._build_conflicts_set(components)
-                mrv_model = MRV.MRV_Model(components, self._CONFLICTS)
+                                conflicts.add(MRV.conflict_key(ece_class1["class"], ece_class2["class"]))
+                components = course_components[i] + course_components[j]
+                self._build_conflicts_set(components, conflicts, masks_cache)
+                mrv_model = MRV.MRV_Model(components, conflicts, limit=1, randomize=False)
                 mrv_model.solve()
                 if len(mrv_model.get_valid_schedules()) == 0:
                     course_conflicts.append(f"{c1['objects'][0]['course']} conflicts with {c2['objects'][0]['course']}")
         if len(course_conflicts) > 0:
             return {"schedules":[], "aliases":[],
                 "errmsg": "No valid schedules found. " + ', and '.join(course_conflicts) + '.'}
-        courses_dict = self._create_course_dict(courses_obj)
-        (components, aliases) = self._create_components(courses_dict)
+        components = [c for course in course_components for c in course]
         cardinality = self._cross_prod_cardinality(components)
         print("Cross product cardinality: " + str(cardinality))
-        self._build_conflicts_set(components)
-        mrv_model = MRV.MRV_Model(components, self._CONFLICTS)
+        self._build_conflicts_set(components, conflicts, masks_cache)
+        mrv_model = MRV.MRV_Model(components, conflicts)
         mrv_model.solve()
         valid_schedules = mrv_model.get_valid_schedules()
         if len(valid_schedules) == 0:
@@ -294,6 +309,6 @@ class ScheduleFactory:
                 "errmsg": "No schedules to display: all schedules have time conflicts."}
         shuffle(valid_schedules)
         print(f"Exhaustive (MRV): {len(valid_schedules)}")
-        self._map_components_to_blocks(components)
-        sorted_schedules = self._master_sort(valid_schedules, prefs)
+        component_blocks = self._map_components_to_blocks(components)
+        sorted_schedules = self._master_sort(valid_schedules, component_blocks, prefs)
         return {"schedules":[[c[0] for c in s._schedule] for s in sorted_schedules], "aliases":aliases}
@@ -15,12 +15,22 @@ from typing import Callable, Any
 from urllib.parse import urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
 logging.basicConfig(format="%(asctime)s [%(levelname)s]: %(message)s")
 logger = logging.getLogger(__name__)
 
+# patterns used once per page or table row are compiled once up front
+URL_PATH_UNSAFE_PATTERN = re.compile(r"[^a-z0-9/]", re.IGNORECASE)
+SECTION_PATTERN = re.compile(
+    r"^\s*(lecture|lab|lecture/lab|lab/lecture|seminar|clinical|thesis)\s*"  # component type
+    r"([a-z\d]{1,6})\s*"  # section
+    r"\((\d{5})\)",  # class ID
+    re.IGNORECASE,
+)
+
 
 @dataclass
 class Course:
@@ -36,6 +46,7 @@ class Course:
 
 class Scraper:
     ROOT = "https://apps.ualberta.ca/catalogue"
+    REQUEST_TIMEOUT_SECONDS = 30
 
     def __init__(
         self,
@@ -57,6 +68,12 @@ class Scraper:
         )
         self.use_processes = use_processes
         self.http_client = requests.Session()
+        # every request goes to the same host, and urllib3 only keeps 10 connections
+        # per host by default; size the pool to the worker count so that with -j > 10
+        # connections are reused instead of being opened and discarded per request
+        self.http_client.mount(
+            "https://", HTTPAdapter(pool_maxsize=max(max_workers, 10))
+        )
 
     def _ttl_expired(self, file: Path) -> bool:
         file_mtime = datetime.fromtimestamp(file.stat().st_mtime)
@@ -75,7 +92,7 @@ class Scraper:
         # basic slugify, this breaks 1:1 mappings between URL:disk cache
         # but for our purposes, this is fine (for example, if 2 URLs differ by a character that's replaced)
         sanitized_path = (
-            re.sub(r"[^a-z0-9/]", "_", urlparse(url).path, flags=re.IGNORECASE)
+            URL_PATH_UNSAFE_PATTERN.sub("_", urlparse(url).path)
             .lstrip("/")
             .lower()
         )
@@ -94,7 +111,7 @@ class Scraper:
         if len(resp) == 0:
             self.cache_misses += 1
             logger.debug(f"cache not valid or non-existent, populating it for {url=}")
-            web_resp = self.http_client.get(url)
+            web_resp = self.http_client.get(url, timeout=self.REQUEST_TIMEOUT_SECONDS)
             if web_resp.status_code == 200 and len(web_resp.content):
                 resp = web_resp.content
                 with open(cached_location, "wb") as req_content:
@@ -156,15 +173,13 @@ class Scraper:
         course_titles = courses_soup.select(".course.first h2 > a")
         # eg matches "331" in "AN TR 331", and asserts the subject prefixes the course number
         # eg course_number_pattern = r"CMPUT\s+(\d{1,4}\w{1,3})"
+        course_number_pattern = re.compile(
+            re.escape(subject.replace("_", " ")) + r"\s+(\d{1,4}\w{1,3})"
+        )
         courses = []
         for course_title in course_titles:
             try:
-                course_number_pattern = (
-                    re.escape(subject.replace("_", " ")) + r"\s+(\d{1,4}\w{1,3})"
-                )
-                course_number = re.search(
-                    course_number_pattern, course_title.text
-                ).group(1)
+                course_number = course_number_pattern.search(course_title.text).group(1)
                 courses.append(Course(subject=subject, number=course_number))
             except AttributeError as e:
                 raise AttributeError(
@@ -226,14 +241,7 @@ class Scraper:
                 for tr in table_rows:
                     # Section
                     tr_section = tr.find("td", {"data-card-title": "Section"})
-                    tr_section_pattern = (
-                        r"^\s*(lecture|lab|lecture/lab|lab/lecture|seminar|clinical|thesis)\s*"  # component type
-                        r"([a-z\d]{1,6})\s*"  # section
-                        r"\((\d{5})\)"  # class ID
-                    )
-                    section_search = re.search(
-                        tr_section_pattern, tr_section.text, re.IGNORECASE
-                    )
+                    section_search = SECTION_PATTERN.search(tr_section.text)
                     component, section, class_id = section_search.group(1, 2, 3)
 
                     # Class times
@@ -0,0 +1,11 @@
+from functools import lru_cache
+
+# Converts a catalogue time such as "09:00 AM" to minutes since midnight.
+# Class times repeat heavily across classes, so parsed results are cached.
+@lru_cache(maxsize=4096)
+def str_t_to_int(str_t):
+    h = int(str_t[0:2])
+    m = int(str_t[3:5])
+    if h > 12: return None
+    h = h % 12 + (12 if str_t[6:9] == 'PM' else 0)
+    return h*60 + m